@@ -1,9 +1,33 @@
 """Configuration management from environment variables and Lua setup."""
 import os
+import functools
 from dataclasses import dataclass
 from typing import Optional, Dict, Any
 
 
+# Environment variables consulted by Config, read once at import. The backend
+# is a long-lived process whose environment does not change after startup.
+_ENV_KEYS = (
+    'AI_REQUEST_PROVIDER',
+    'AI_REQUEST_MODEL',
+    'AI_REQUEST_TIMEOUT',
+    'AI_REQUEST_MAX_TOOL_CALLS',
+    'ANTHROPIC_API_KEY',
+    'OPENAI_API_KEY',
+    'AI_REQUEST_LOCAL_API_KEY',
+    'AI_REQUEST_LOCAL_URL',
+)
+_ENV_CACHE: Dict[str, Optional[str]] = {k: os.environ.get(k) for k in _ENV_KEYS}
+
+# Default model per provider; its keys are the supported providers
+_DEFAULT_MODELS = {
+    'anthropic': 'claude-sonnet-4.5',
+    'openai': 'gpt-4',
+    'local': 'deepseek-coder:6.7b',
+}
+_VALID_PROVIDERS = frozenset(_DEFAULT_MODELS)
+
+
 SYSTEM_PROMPT = """You are a precise code completion assistant.
 
 CRITICAL RULES:
@@ -42,35 +66,34 @@ class Config:
         API keys always prefer environment variables for security.
         """
         # Get provider (from dict or env)
-        provider = config_dict.get('provider') or os.getenv('AI_REQUEST_PROVIDER', 'anthropic')
+        provider = config_dict.get('provider') or _ENV_CACHE.get('AI_REQUEST_PROVIDER') or 'anthropic'
 
         # Validate provider
-        valid_providers = ['anthropic', 'openai', 'local']
-        if provider not in valid_providers:
-            raise ValueError(f"Invalid provider '{provider}'. Must be one of: {valid_providers}")
+        if provider not in _VALID_PROVIDERS:
+            raise ValueError(f"Invalid provider '{provider}'. Must be one of: {list(_DEFAULT_MODELS)}")
 
         # Get model (from dict, env, or defaults)
-        model = config_dict.get('model') or os.getenv('AI_REQUEST_MODEL') or cls._default_model(provider)
+        model = config_dict.get('model') or _ENV_CACHE.get('AI_REQUEST_MODEL') or cls._default_model(provider)
 
         # Get timeout (from dict or env)
         timeout = config_dict.get('timeout')
         if timeout is None:
-            timeout = int(os.getenv('AI_REQUEST_TIMEOUT', '30'))
+            timeout = int(_ENV_CACHE.get('AI_REQUEST_TIMEOUT') or '30')
 
         # Get max_tool_calls (from dict or env)
         max_tool_calls = config_dict.get('max_tool_calls')
         if max_tool_calls is None:
-            max_tool_calls = int(os.getenv('AI_REQUEST_MAX_TOOL_CALLS', '3'))
+            max_tool_calls = int(_ENV_CACHE.get('AI_REQUEST_MAX_TOOL_CALLS') or '3')
 
         # Get API key - ALWAYS prefer env vars for security, only use dict as fallback
         api_key = config_dict.get('api_key')
         if not api_key:
             if provider == 'anthropic':
-                api_key = os.getenv('ANTHROPIC_API_KEY')
+                api_key = _ENV_CACHE.get('ANTHROPIC_API_KEY')
             elif provider == 'openai':
-                api_key = os.getenv('OPENAI_API_KEY')
+                api_key = _ENV_CACHE.get('OPENAI_API_KEY')
             elif provider == 'local':
-                api_key = os.getenv('AI_REQUEST_LOCAL_API_KEY', 'none')
+                api_key = _ENV_CACHE.get('AI_REQUEST_LOCAL_API_KEY') or 'none'
 
         if not api_key and provider != 'local':
             raise ValueError(f"API key not found for provider '{provider}'. Set {provider.upper()}_API_KEY environment variable.")
@@ -78,7 +101,7 @@ class Config:
         # Get base_url (from dict or env)
         base_url = config_dict.get('base_url')
         if not base_url and provider == 'local':
-            base_url = os.getenv('AI_REQUEST_LOCAL_URL', 'http://localhost:11434/v1')
+            base_url = _ENV_CACHE.get('AI_REQUEST_LOCAL_URL') or 'http://localhost:11434/v1'
 
         return cls(
             provider=provider,
@@ -91,15 +114,16 @@ class Config:
 
     @classmethod
     def from_env(cls) -> 'Config':
-        """Load configuration from environment variables only."""
-        return cls.from_dict({})
+        """Load configuration from environment variables only (cached)."""
+        return _build_env_config()
 
     @staticmethod
     def _default_model(provider: str) -> str:
         """Get default model for provider."""
-        defaults = {
-            'anthropic': 'claude-sonnet-4.5',
-            'openai': 'gpt-4',
-            'local': 'deepseek-coder:6.7b',
-        }
-        return defaults.get(provider, 'claude-sonnet-4.5')
+        return _DEFAULT_MODELS.get(provider, 'claude-sonnet-4.5')
+
+
+@functools.lru_cache(maxsize=1)
+def _build_env_config() -> Config:
+    """Build the environment-only Config once; the environment is fixed at import."""
+    return Config.from_dict({})
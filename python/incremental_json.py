@@ -0,0 +1,152 @@
+"""Incremental JSON parsing for streamed tool-call arguments."""
+import re
+import orjson
+from typing import Any, List, Tuple
+
+# Characters that change parser state outside and inside a string
+_STRUCTURAL = re.compile(r'[{}\[\]",]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# A JSON literal cut off part way through, e.g. the "n" of a pending "null"
+_PARTIAL_LITERAL = re.compile(r'(?:t|tr|tru|f|fa|fal|fals|n|nu|nul)$')
+_LITERALS = {'t': 'true', 'f': 'false', 'n': 'null'}
+
+
+class IncrementalJsonParser:
+    """
+    Parse a JSON document that arrives in chunks.
+
+    feed() keeps the chunks and tracks container nesting, string and escape
+    state as they arrive, so the parser knows whether the document is
+    complete without attempting a parse. finalize() parses the document once
+    at the end; snapshot() closes any open string and containers to give a
+    best-effort value for a document that is still streaming.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0
+        # Open containers as [closer, open offset, offset of last comma or -1]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str):
+        """Add the next chunk of the document."""
+        self._chunks.append(chunk)
+        base = self._length
+        self._length += len(chunk)
+
+        stack = self._stack
+        end = len(chunk)
+        pos = 0
+        if self._escape and end:
+            # First character is the escaped one
+            self._escape = False
+            pos = 1
+
+        while pos < end:
+            if self._in_string:
+                m = _STRING_SPECIAL.search(chunk, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                if m.group() == '"':
+                    self._in_string = False
+                elif pos < end:
+                    pos += 1
+                else:
+                    self._escape = True
+            else:
+                m = _STRUCTURAL.search(chunk, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                c = m.group()
+                if c == '"':
+                    self._in_string = True
+                elif c == ',':
+                    if stack:
+                        stack[-1][2] = base + pos - 1
+                elif c == '{':
+                    stack.append(['}', base + pos - 1, -1])
+                elif c == '[':
+                    stack.append([']', base + pos - 1, -1])
+                elif stack:
+                    stack.pop()
+
+    @property
+    def complete(self) -> bool:
+        """Whether the document fed so far is structurally closed."""
+        return not self._stack and not self._in_string and bool(self._text().strip())
+
+    def finalize(self, allow_partial: bool = False) -> Any:
+        """
+        Parse the full document.
+
+        Args:
+            allow_partial: Never raise; a document cut off mid-stream is
+                completed as by snapshot(), and a malformed one gives None
+
+        Returns:
+            The parsed value, or None if nothing but whitespace was fed
+
+        Raises:
+            orjson.JSONDecodeError: If the document is malformed and
+                allow_partial is not set
+        """
+        text = self._text()
+        if not text.strip():
+            return None
+        if not allow_partial:
+            return orjson.loads(text)
+        # The tracked state already tells a truncated document apart, so
+        # only a complete but malformed one reaches the exception path
+        if not self.complete:
+            return self.snapshot()
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return None
+
+    def snapshot(self) -> Any:
+        """Best-effort value of the document so far, or None if none can be built."""
+        text = self._text()
+        if not text.strip():
+            return None
+
+        for candidate in self._repairs(text):
+            try:
+                return orjson.loads(candidate)
+            except ValueError:
+                continue
+        return None
+
+    def _text(self) -> str:
+        """Join the chunks once; later calls reuse the joined string."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def _repairs(self, text: str) -> Tuple[str, ...]:
+        """Candidate completions of a truncated document, most faithful first."""
+        closers = "".join(entry[0] for entry in reversed(self._stack))
+
+        if self._in_string:
+            # Drop a dangling backslash and close the string
+            head = text[:-1] if self._escape else text
+            candidates = [head + '"' + closers]
+        else:
+            candidates = [text + closers]
+            m = _PARTIAL_LITERAL.search(text)
+            if m:
+                literal = _LITERALS[m.group()[0]]
+                candidates.append(text[:m.start()] + literal + closers)
+
+        # Drop the innermost container's unfinished member
+        if self._stack:
+            _, opened, comma = self._stack[-1]
+            cut = comma if comma > opened else opened + 1
+            candidates.append(text[:cut] + closers)
+
+        return tuple(candidates)
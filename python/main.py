@@ -2,19 +2,103 @@
 """
 AI Request backend - handles LLM API calls via stdio JSON protocol.
 """
+import io
+import os
 import sys
-import json
-from typing import Iterator, Dict, Any, Optional
+import time
+import orjson
+from collections import OrderedDict
+from typing import Iterator, Dict, Any, List, Optional
 from config import Config, SYSTEM_PROMPT
-from providers.anthropic_client import AnthropicClient
-from providers.openai_client import OpenAIClient
-from tools import get_tool_definitions, convert_tools_for_anthropic
+from tools import get_tool_definitions, get_anthropic_tool_definitions
+
+
+class ConversationStore(OrderedDict):
+    """
+    Conversation state keyed by request_id, bounded by size and age.
+
+    Entries are normally removed once their tool response is handled, but a
+    request whose tool call is never answered would otherwise stay forever.
+    Each entry carries a 'ts' timestamp; inserting evicts the oldest entries
+    while the store is over max_size or they are older than ttl seconds.
+    """
+
+    def __init__(self, max_size: int = 64, ttl: float = 600.0):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def __setitem__(self, key: str, value: Dict[str, Any]):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+
+        now = time.monotonic()
+        while self:
+            oldest = next(iter(self.values()))
+            if len(self) <= self.max_size and now - oldest['ts'] <= self.ttl:
+                break
+            self.popitem(last=False)
+
 
 # Global state for tracking conversations
-conversations: Dict[str, Dict[str, Any]] = {}
+conversations: Dict[str, Dict[str, Any]] = ConversationStore()
+
+# Streamed responses are written to stdout in batches. These event types are
+# acted on by the editor straight away, so they always flush the batch.
+FLUSH_TYPES = frozenset({'done', 'tool_call', 'error'})
+FLUSH_BYTES = 4096
+FLUSH_INTERVAL = 0.05  # seconds
+IOV_MAX = 1024  # max buffers per writev call on Linux and macOS
+
+# Tool definitions are static; both provider formats are built once in tools
+_TOOLS_OPENAI = get_tool_definitions()
+_TOOLS_ANTHROPIC = get_anthropic_tool_definitions()
+
+# Fields accepted per request type: (name, allowed types, required)
+REQUEST_FIELDS = {
+    'complete': (
+        ('context', str, True),
+        ('prompt', (str, type(None)), False),
+        ('config', (dict, type(None)), False),
+        ('request_id', str, False),
+    ),
+    'tool_response': (
+        ('request_id', str, True),
+        ('tool_call_id', str, True),
+        ('content', str, False),
+    ),
+}
+
+
+def validate_request(request: Any) -> str:
+    """
+    Validate a request against REQUEST_FIELDS in a single pass.
 
+    Returns:
+        The request type
 
-def process_request(request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    Raises:
+        ValueError: If the request is malformed
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+
+    request_type = request.get('type')
+    fields = REQUEST_FIELDS.get(request_type)
+    if fields is None:
+        raise ValueError(f"Unknown request type: {request_type}")
+
+    for name, types, required in fields:
+        if name in request:
+            if not isinstance(request[name], types):
+                raise ValueError(f"Invalid '{name}' in {request_type} request")
+        elif required:
+            raise ValueError(f"Missing '{name}' in {request_type} request")
+
+    return request_type
+
+
+def process_request(request: Dict[str, Any], reuse_events: bool = False) -> Iterator[Dict[str, Any]]:
     """
     Process a request and yield response events.
 
@@ -28,6 +112,10 @@ def process_request(request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
             "tool_call_id": "..." (for tool_response),
             "content": "..." (for tool_response)
         }
+        reuse_events: Let completion and thinking events reuse one dict per
+            event type, updated in place. Only for consumers that are done
+            with each event before pulling the next one and never keep it,
+            like main(), which serializes every event straight away.
 
     Yields:
         {"type": "completion", "content": "..."}
@@ -37,88 +125,89 @@ def process_request(request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
         {"type": "error", "message": "..."}
     """
     try:
-        request_type = request.get('type')
-
-        if request_type == 'complete':
-            yield from handle_complete_request(request)
-        elif request_type == 'tool_response':
-            yield from handle_tool_response(request)
-        else:
-            yield {"type": "error", "message": f"Unknown request type: {request_type}"}
+        request_type = validate_request(request)
+        yield from REQUEST_HANDLERS[request_type](request, reuse_events)
 
     except Exception as e:
         yield {"type": "error", "message": str(e)}
 
 
-def handle_complete_request(request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
-    """Handle initial completion request."""
+def handle_complete_request(request: Dict[str, Any], reuse_events: bool = False) -> Iterator[Dict[str, Any]]:
+    """Handle initial completion request. See process_request for reuse_events."""
     # Get config (from request or environment)
-    if 'config' in request and request['config']:
-        config = Config.from_dict(request['config'])
+    config_dict = request.get('config')
+    if config_dict:
+        config = Config.from_dict(config_dict)
     else:
         config = Config.from_env()
 
-    # Get tools
-    tools = get_tool_definitions()
     is_anthropic = config.provider == 'anthropic'
 
-    # Create client
+    # Create client; provider SDKs are imported on first use to keep startup fast.
+    # Only the content of text events is kept below, so reuse is safe here.
     if is_anthropic:
-        client = AnthropicClient(config.api_key, config.model)
-        tools = convert_tools_for_anthropic(tools)
+        from providers.anthropic_client import AnthropicClient
+        client = AnthropicClient(config.api_key, config.model, reuse_events=reuse_events)
+        tools = _TOOLS_ANTHROPIC
     elif config.provider in ['openai', 'local']:
-        client = OpenAIClient(config.api_key, config.model, config.base_url)
+        from providers.openai_client import OpenAIClient
+        client = OpenAIClient(config.api_key, config.model, config.base_url, reuse_events=reuse_events)
+        tools = _TOOLS_OPENAI
     else:
         yield {"type": "error", "message": f"Unknown provider: {config.provider}"}
         return
 
-    # Build initial message
+    # Build the user message once, in the client's format; the stored
+    # conversation and the request share it
     context = request['context']
     prompt = request.get('prompt')
-    user_message = context
-    if prompt:
-        user_message += f"\n\n{prompt}"
+    user_message = client.build_user_content(context, prompt)
 
     # Store conversation state
     request_id = request.get('request_id', str(id(request)))
-    conversations[request_id] = {
+    conv = conversations[request_id] = {
         'config': config,
         'client': client,
         'tools': tools,
         'is_anthropic': is_anthropic,
         'user_message': user_message,
-        'tool_calls': [],
+        'tool_calls': {},
         'completion_parts': [],
+        'ts': time.monotonic(),
     }
 
     # Stream completion
-    for event in client.stream_completion(context, prompt, tools):
-        if event['type'] == 'tool_call':
-            # Store tool call and wait for response
-            conversations[request_id]['tool_calls'].append(event)
-        elif event['type'] == 'completion':
+    # Bind the per-event lookups once; this loop runs for every streamed event
+    tool_calls = conv['tool_calls']
+    completion_parts = conv['completion_parts']
+    for event in client.stream_completion(context, prompt, tools, user_message):
+        event_type = event['type']
+        if event_type == 'completion':
             # Store completion parts
-            conversations[request_id]['completion_parts'].append(event['content'])
+            completion_parts.append(event['content'])
+        elif event_type == 'tool_call':
+            # Store tool call and wait for response
+            tool_calls[event['id']] = event
         yield event
 
 
-def handle_tool_response(request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
-    """Handle tool response and continue conversation."""
-    request_id = request.get('request_id')
-    if not request_id or request_id not in conversations:
+def handle_tool_response(request: Dict[str, Any], reuse_events: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Handle tool response and continue conversation.
+
+    The continuation always yields fresh dicts, so reuse_events has no effect.
+    """
+    request_id = request['request_id']
+    conv = conversations.get(request_id)
+    if conv is None:
         yield {"type": "error", "message": "Invalid or expired request_id"}
         return
 
-    conv = conversations[request_id]
-    tool_call_id = request.get('tool_call_id')
+    tool_call_id = request['tool_call_id']
     tool_content = request.get('content', '')
 
     # Find the corresponding tool call
-    tool_call = None
-    for tc in conv['tool_calls']:
-        if tc.get('id') == tool_call_id:
-            tool_call = tc
-            break
+    tool_call = conv['tool_calls'].get(tool_call_id)
 
     if not tool_call:
         yield {"type": "error", "message": f"Tool call {tool_call_id} not found"}
@@ -134,35 +223,31 @@ def handle_tool_response(request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
     cleanup_conversation(request_id)
 
 
+# Handler per request type; validate_request guarantees the key exists
+REQUEST_HANDLERS = {
+    'complete': handle_complete_request,
+    'tool_response': handle_tool_response,
+}
+
+
 def continue_anthropic_conversation(
     conv: Dict[str, Any],
     tool_call: Dict[str, Any],
     tool_content: str
 ) -> Iterator[Dict[str, Any]]:
     """Continue Anthropic conversation with tool result."""
-    from anthropic import Anthropic
-
     client = conv['client'].client
     model = conv['client'].model
     tools = conv['tools']
 
-    # Build message history
-    assistant_content = []
-
-    # Add completion text if any
-    if conv['completion_parts']:
-        assistant_content.append({
-            "type": "text",
-            "text": "".join(conv['completion_parts'])
-        })
-
-    # Add tool use
-    assistant_content.append({
+    # Build message history: completion text (if any) followed by the tool use
+    text = "".join(conv['completion_parts'])
+    assistant_content = ([{"type": "text", "text": text}] if text else []) + [{
         "type": "tool_use",
         "id": tool_call['id'],
         "name": tool_call['name'],
         "input": tool_call['args']
-    })
+    }]
 
     messages = [
         {"role": "user", "content": conv['user_message']},
@@ -186,7 +271,7 @@ def continue_anthropic_conversation(
     ) as stream:
         for event in stream:
             if event.type == 'content_block_delta':
-                if hasattr(event.delta, 'text'):
+                if getattr(event.delta, 'type', None) == 'text_delta':
                     yield {
                         'type': 'completion',
                         'content': event.delta.text
@@ -207,7 +292,7 @@ def continue_openai_conversation(
 
     # Build message history
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        conv['client'].SYSTEM_MESSAGE,
         {"role": "user", "content": conv['user_message']},
         {
             "role": "assistant",
@@ -217,7 +302,7 @@ def continue_openai_conversation(
                 "type": "function",
                 "function": {
                     "name": tool_call['name'],
-                    "arguments": json.dumps(tool_call['args'])
+                    "arguments": orjson.dumps(tool_call['args']).decode()
                 }
             }]
         },
@@ -254,21 +339,85 @@ def cleanup_conversation(request_id: str):
         del conversations[request_id]
 
 
+def writev_all(fd: int, chunks: List[bytes]):
+    """Write all chunks to fd with os.writev, resuming after short writes."""
+    i = 0
+    while i < len(chunks):
+        written = os.writev(fd, chunks[i:i + IOV_MAX])
+        while written:
+            size = len(chunks[i])
+            if written >= size:
+                written -= size
+                i += 1
+            else:
+                chunks[i] = chunks[i][written:]
+                written = 0
+
+
+class ResponseWriter:
+    """
+    Buffer JSON-line responses and write them to a binary stream in batches.
+
+    On POSIX each batch goes out as one os.writev on the stream's file
+    descriptor; streams without one (e.g. in tests) get a joined write.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.fd = None
+        if hasattr(os, 'writev'):
+            try:
+                self.fd = stream.fileno()
+            except (OSError, ValueError, io.UnsupportedOperation):
+                pass
+        # Anything already buffered in the stream must precede raw fd writes
+        stream.flush()
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, response: Dict[str, Any]):
+        """Queue a response, flushing on terminal events or size/time thresholds."""
+        data = orjson.dumps(response, option=orjson.OPT_APPEND_NEWLINE)
+        self.chunks.append(data)
+        self.size += len(data)
+        if (response['type'] in FLUSH_TYPES
+                or self.size > FLUSH_BYTES
+                or time.monotonic() - self.last_flush > FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """Write out everything queued so far."""
+        if self.chunks:
+            if self.fd is not None:
+                writev_all(self.fd, self.chunks)
+            else:
+                self.stream.write(b"".join(self.chunks))
+                self.stream.flush()
+            self.chunks = []
+            self.size = 0
+        self.last_flush = time.monotonic()
+
+
 def main():
     """Main stdio loop."""
-    for line in sys.stdin:
+    writer = ResponseWriter(sys.stdout.buffer)
+    # Read raw bytes; orjson parses UTF-8 directly without a str decode first
+    for line in iter(sys.stdin.buffer.readline, b''):
         try:
-            request = json.loads(line)
+            request = orjson.loads(line)
 
-            for response in process_request(request):
-                print(json.dumps(response), flush=True)
+            # Each event is serialized before the next is pulled, so text
+            # events can safely reuse one dict
+            for response in process_request(request, reuse_events=True):
+                writer.write(response)
 
-        except json.JSONDecodeError as e:
-            error = {"type": "error", "message": f"Invalid JSON: {e}"}
-            print(json.dumps(error), flush=True)
+        except orjson.JSONDecodeError as e:
+            writer.write({"type": "error", "message": f"Invalid JSON: {e}"})
         except Exception as e:
-            error = {"type": "error", "message": str(e)}
-            print(json.dumps(error), flush=True)
+            writer.write({"type": "error", "message": str(e)})
+        finally:
+            writer.flush()
 
 
 if __name__ == "__main__":
@@ -1 +1,171 @@
 """LLM provider clients."""
+import asyncio
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+def build_user_message(context: str, prompt: Optional[str]) -> str:
+    """
+    Build the user message from the editor context and optional prompt.
+
+    Callers build it once per request and hand it to the provider client
+    (see stream_completion's user_content) rather than each copying a
+    potentially large buffer context.
+    """
+    if prompt:
+        return f"{context}\n\n{prompt}"
+    return context
+
+
+def _split_sse_data(buffer: bytes) -> Tuple[List[bytes], bytes]:
+    """
+    Split the complete lines off a buffer of SSE bytes.
+
+    Returns the data payloads of those lines and the trailing partial line.
+    The provider APIs send each event's JSON on a single data line, so
+    event names, comments and blank separators can simply be skipped.
+    """
+    lines = buffer.split(b'\n')
+    rest = lines.pop()
+    payloads = []
+    for line in lines:
+        if line.startswith(b'data:'):
+            payload = line[5:].rstrip(b'\r')
+            payloads.append(payload[1:] if payload.startswith(b' ') else payload)
+    return payloads, rest
+
+
+def iter_sse_data(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Yield the data payload of each server-sent event from a raw response body.
+
+    Works on bytes throughout: orjson parses the payloads directly, so the
+    body is never decoded to str first.
+    """
+    buffer = b''
+    for chunk in chunks:
+        buffer += chunk
+        if b'\n' in chunk:
+            payloads, buffer = _split_sse_data(buffer)
+            yield from payloads
+    if buffer:
+        yield from _split_sse_data(buffer + b'\n')[0]
+
+
+async def aiter_sse_data(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Async counterpart of iter_sse_data."""
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        if b'\n' in chunk:
+            payloads, buffer = _split_sse_data(buffer)
+            for payload in payloads:
+                yield payload
+    if buffer:
+        for payload in _split_sse_data(buffer + b'\n')[0]:
+            yield payload
+
+
+class DeltaBuffer:
+    """
+    Coalesce streamed text deltas into fewer, larger events.
+
+    Text is held until max_chars have accumulated or interval seconds have
+    passed since the last emitted event. An interval of 0 emits every delta.
+
+    With reuse_event, every flush returns the same dict with its content
+    replaced, so a consumer must be done with an event (e.g. have written
+    it out) before asking for the next one, and must not keep it.
+    """
+
+    __slots__ = ('event_type', 'interval', 'max_chars', 'parts', 'size', 'last_flush', 'event')
+
+    def __init__(
+        self,
+        event_type: str,
+        interval: float,
+        max_chars: int = 64,
+        reuse_event: bool = False,
+    ):
+        self.event_type = event_type
+        self.interval = interval
+        self.max_chars = max_chars
+        self.event = {'type': event_type, 'content': ''} if reuse_event else None
+        self.parts: List[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, text: str) -> Optional[Dict[str, Any]]:
+        """Buffer a delta, returning an event if the buffer is due to flush."""
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.max_chars or time.monotonic() - self.last_flush >= self.interval:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        """Return an event with all buffered text, or None if there is none."""
+        if not self.parts:
+            return None
+        text = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        event = self.event
+        if event is None:
+            return {'type': self.event_type, 'content': text}
+        event['content'] = text
+        return event
+
+
+async def stream_many(
+    clients: Sequence[Any],
+    context: str,
+    prompt: Optional[str],
+    tools: Sequence[List[Dict[str, Any]]],
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Stream one completion from each client concurrently.
+
+    Every stream is started before any is awaited, so the whole fan-out
+    takes as long as the slowest stream rather than the sum of them.
+
+    Args:
+        clients: Provider clients; they must not use reuse_events, since
+            events are queued before the caller sees them
+        tools: Tool definitions per client, in that client's format
+
+    Yields:
+        (client index, event) in arrival order. A client whose stream fails
+        yields {"type": "error", "message": "..."} in place of the rest of
+        its stream without stopping the others.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(index: int, client: Any, client_tools: List[Dict[str, Any]]):
+        try:
+            async for event in client.stream_completion_async(context, prompt, client_tools):
+                queue.put_nowait((index, event))
+        except Exception as e:
+            queue.put_nowait((index, {"type": "error", "message": str(e)}))
+        finally:
+            # Marks this stream as finished
+            queue.put_nowait((index, None))
+
+    tasks = [
+        asyncio.create_task(pump(index, client, client_tools))
+        for index, (client, client_tools) in enumerate(zip(clients, tools))
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            index, event = await queue.get()
+            if event is None:
+                remaining -= 1
+            else:
+                yield index, event
+    finally:
+        # Stop any streams still running if the caller stops early
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,94 +1,266 @@
 """Anthropic API client with streaming support."""
-import json
-from typing import Iterator, Dict, Any, List, Optional
-from anthropic import Anthropic
+import functools
+import orjson
+from typing import AsyncIterator, Iterator, Dict, Any, List, Optional
+from anthropic import Anthropic, AsyncAnthropic
 from config import SYSTEM_PROMPT
+from incremental_json import IncrementalJsonParser
+from providers import DeltaBuffer, aiter_sse_data, iter_sse_data
+
+
+@functools.lru_cache(maxsize=4)
+def _get_anthropic(api_key: str) -> Anthropic:
+    """Shared SDK client per API key, so its connection pool is reused."""
+    return Anthropic(api_key=api_key)
 
 
 class AnthropicClient:
     """Client for Anthropic Claude API."""
 
-    def __init__(self, api_key: str, model: str):
-        self.client = Anthropic(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        coalesce_ms: float = 10.0,
+        reuse_events: bool = False,
+    ):
+        """
+        Args:
+            coalesce_ms: Window for merging streamed text deltas into one
+                event (flushed early at 64 characters); 0 disables merging
+            reuse_events: Yield one reused dict per text event type instead
+                of a new dict per event; only for consumers that finish with
+                each event before advancing the stream and never keep it
+        """
+        self.client = _get_anthropic(api_key)
+        self.api_key = api_key
         self.model = model
+        self.coalesce = coalesce_ms / 1000
+        self.reuse_events = reuse_events
+
+    # Contexts shorter than this are sent without a cache breakpoint: they
+    # fall below the API's minimum cacheable prompt length anyway
+    CACHE_MIN_CHARS = 1024
+
+    @staticmethod
+    def build_user_content(context: str, prompt: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Build the user message as content blocks: the context, marked for
+        prompt caching when long enough, followed by the prompt as its own
+        block so the context is never copied into a combined string.
+
+        The context is re-sent unchanged while the user keeps asking about
+        the same buffer, so the expected case is a cache hit on the prefix
+        up to the context block, with only the prompt processed afresh.
+        Built once per request and passed to stream_completion, so the
+        stored conversation and the request share it.
+        """
+        block = {"type": "text", "text": context}
+        if len(context) > AnthropicClient.CACHE_MIN_CHARS:
+            block["cache_control"] = {"type": "ephemeral"}
+        content = [block]
+        if prompt:
+            content.append({"type": "text", "text": prompt})
+        return content
 
     def stream_completion(
         self,
         context: str,
         prompt: Optional[str],
         tools: List[Dict[str, Any]],
+        user_content: Optional[List[Dict[str, Any]]] = None,
     ) -> Iterator[Dict[str, Any]]:
         """
         Stream a completion from Claude.
 
+        Args:
+            user_content: The user message from build_user_content, if the
+                caller already built it; otherwise built from context and prompt
+
         Yields:
             {"type": "thinking", "content": "..."}
             {"type": "completion", "content": "..."}
             {"type": "tool_call", "name": "...", "args": {...}}
             {"type": "done"}
         """
-        # Build messages
-        user_message = context
-        if prompt:
-            user_message += f"\n\n{prompt}"
-
-        messages = [{"role": "user", "content": user_message}]
-
-        # Track current tool use block
-        current_tool = None
-        tool_input_json = ""
-
-        # Stream the response
-        with self.client.messages.stream(
-            model=self.model,
-            max_tokens=4096,
-            messages=messages,
-            system=SYSTEM_PROMPT,
-            tools=tools if tools else None,
-        ) as stream:
-            for event in stream:
-                # Handle text content
-                if event.type == 'content_block_delta':
-                    if hasattr(event.delta, 'text'):
-                        yield {
-                            'type': 'completion',
-                            'content': event.delta.text
-                        }
-                    # Handle thinking (extended thinking in some models)
-                    elif hasattr(event.delta, 'thinking'):
-                        yield {
-                            'type': 'thinking',
-                            'content': event.delta.thinking
-                        }
-                    # Accumulate tool input JSON
-                    elif hasattr(event.delta, 'type') and event.delta.type == 'input_json_delta':
-                        if hasattr(event.delta, 'partial_json'):
-                            tool_input_json += event.delta.partial_json
-
-                # Handle tool call start
-                elif event.type == 'content_block_start':
-                    if hasattr(event.content_block, 'type') and event.content_block.type == 'tool_use':
-                        current_tool = {
-                            'id': event.content_block.id,
-                            'name': event.content_block.name,
-                        }
-                        tool_input_json = ""
-
-                # Handle tool call completion
-                elif event.type == 'content_block_stop':
-                    if current_tool:
-                        try:
-                            args = json.loads(tool_input_json) if tool_input_json else {}
-                        except json.JSONDecodeError:
-                            args = {}
-
-                        yield {
-                            'type': 'tool_call',
-                            'id': current_tool['id'],
-                            'name': current_tool['name'],
-                            'args': args,
-                        }
-                        current_tool = None
-                        tool_input_json = ""
+        # Read the raw SSE body; the SDK's event objects are never built
+        with self.client.messages.with_streaming_response.create(
+            **self._stream_args(context, prompt, tools, user_content)
+        ) as response:
+            state = (_StreamState if tools else _TextStreamState)(self.coalesce, self.reuse_events)
+            for data in iter_sse_data(response.iter_bytes()):
+                out = state.handle(orjson.loads(data))
+                if out is not None:
+                    yield out
+            out = state.flush()
+            if out is not None:
+                yield out
 
         yield {'type': 'done'}
+
+    async def stream_completion_async(
+        self,
+        context: str,
+        prompt: Optional[str],
+        tools: List[Dict[str, Any]],
+        user_content: Optional[List[Dict[str, Any]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a completion from Claude without blocking the event loop.
+
+        Yields the same events as stream_completion, so several completions
+        can run concurrently, e.g. through providers.stream_many.
+        """
+        # A fresh SDK client per stream: its pooled connections belong to the
+        # running event loop, and leaving the block closes them
+        async with AsyncAnthropic(api_key=self.api_key) as client:
+            async with client.messages.with_streaming_response.create(
+                **self._stream_args(context, prompt, tools, user_content)
+            ) as response:
+                state = (_StreamState if tools else _TextStreamState)(self.coalesce, self.reuse_events)
+                async for data in aiter_sse_data(response.iter_bytes()):
+                    out = state.handle(orjson.loads(data))
+                    if out is not None:
+                        yield out
+                out = state.flush()
+                if out is not None:
+                    yield out
+
+        yield {'type': 'done'}
+
+    def _stream_args(
+        self,
+        context: str,
+        prompt: Optional[str],
+        tools: List[Dict[str, Any]],
+        user_content: Optional[List[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Build the streaming messages.create arguments for a completion."""
+        if user_content is None:
+            user_content = self.build_user_content(context, prompt)
+        args = {
+            'model': self.model,
+            'max_tokens': 4096,
+            'messages': [{"role": "user", "content": user_content}],
+            'system': SYSTEM_PROMPT,
+            'stream': True,
+        }
+        if tools:
+            args['tools'] = tools
+        return args
+
+
+def _raise_stream_error(event: Dict[str, Any]):
+    """Errors can arrive mid-stream after a successful response status."""
+    error = event.get('error') or {}
+    raise RuntimeError(error.get('message') or "Anthropic stream error")
+
+
+class _TextStreamState:
+    """
+    Turns decoded SSE events into backend events for a completion without
+    tools, so the per-event loop carries no tool use bookkeeping.
+    """
+
+    # Streamed delta type -> (event type to yield, delta attribute holding the text)
+    DELTA_EVENTS = {
+        'text_delta': ('completion', 'text'),
+        'thinking_delta': ('thinking', 'thinking'),
+    }
+
+    __slots__ = ('buffers',)
+
+    def __init__(self, coalesce: float, reuse_events: bool = False):
+        # Delta type -> (buffer coalescing its text, delta attribute)
+        self.buffers = {
+            delta_type: (DeltaBuffer(event_type, coalesce, reuse_event=reuse_events), attr)
+            for delta_type, (event_type, attr) in self.DELTA_EVENTS.items()
+        }
+
+    def handle(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Process one stream event, returning the event to yield if any."""
+        event_type = event.get('type')
+
+        if event_type == 'content_block_delta':
+            delta = event['delta']
+            mapped = self.buffers.get(delta.get('type'))
+            if mapped is not None:
+                return mapped[0].add(delta[mapped[1]])
+
+        # A block boundary ends any buffered text, e.g. thinking before text
+        elif event_type == 'content_block_start' or event_type == 'content_block_stop':
+            return self.flush()
+
+        elif event_type == 'error':
+            _raise_stream_error(event)
+
+        return None
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        """
+        Emit buffered text, if any. Blocks stream one at a time, so at most
+        one buffer holds text when this is called at a block boundary.
+        """
+        for buffer, _ in self.buffers.values():
+            out = buffer.flush()
+            if out is not None:
+                return out
+        return None
+
+
+class _StreamState(_TextStreamState):
+    """Stream state for a completion with tools, also tracking tool use blocks."""
+
+    __slots__ = ('current_tool', 'tool_input')
+
+    def __init__(self, coalesce: float, reuse_events: bool = False):
+        super().__init__(coalesce, reuse_events)
+        # Current tool use block as (id, name)
+        self.current_tool = None
+        self.tool_input = None
+
+    def handle(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Process one stream event, returning the event to yield if any."""
+        event_type = event.get('type')
+
+        # Handle deltas, dispatching once on the delta type
+        if event_type == 'content_block_delta':
+            delta = event['delta']
+            delta_type = delta.get('type')
+            # Text and thinking (extended thinking in some models)
+            mapped = self.buffers.get(delta_type)
+            if mapped is not None:
+                return mapped[0].add(delta[mapped[1]])
+            # Accumulate tool input JSON
+            if delta_type == 'input_json_delta' and self.tool_input is not None:
+                self.tool_input.feed(delta['partial_json'])
+
+        # Handle tool call start; a new block also ends any buffered text
+        elif event_type == 'content_block_start':
+            block = event['content_block']
+            if block.get('type') == 'tool_use':
+                self.current_tool = (block['id'], block['name'])
+                self.tool_input = IncrementalJsonParser()
+            return self.flush()
+
+        # Handle tool call completion, or the end of a text/thinking block
+        elif event_type == 'content_block_stop':
+            if self.current_tool:
+                # Arguments cut off mid-stream are completed as far as possible
+                args = self.tool_input.finalize(allow_partial=True) or {}
+
+                tool_id, name = self.current_tool
+                self.current_tool = None
+                self.tool_input = None
+                return {
+                    'type': 'tool_call',
+                    'id': tool_id,
+                    'name': name,
+                    'args': args,
+                }
+            return self.flush()
+
+        elif event_type == 'error':
+            _raise_stream_error(event)
+
+        return None
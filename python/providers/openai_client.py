@@ -1,100 +1,263 @@
 """OpenAI API client with streaming support."""
-import json
-from typing import Iterator, Dict, Any, List, Optional
-from openai import OpenAI
+import functools
+import orjson
+from typing import AsyncIterator, Iterator, Dict, Any, List, Optional
+from openai import AsyncOpenAI, OpenAI
 from config import SYSTEM_PROMPT
+from incremental_json import IncrementalJsonParser
+from providers import DeltaBuffer, aiter_sse_data, build_user_message, iter_sse_data
+
+
+@functools.lru_cache(maxsize=4)
+def _get_openai(api_key: str, base_url: Optional[str]) -> OpenAI:
+    """Shared SDK client per API key and endpoint, so its connection pool is reused."""
+    return OpenAI(api_key=api_key, base_url=base_url)
 
 
 class OpenAIClient:
     """Client for OpenAI API."""
 
-    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+    # Leading system message, shared by reference across requests; the SDK
+    # only reads it, so it must never be mutated
+    SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: Optional[str] = None,
+        coalesce_ms: float = 10.0,
+        reuse_events: bool = False,
+    ):
+        """
+        Args:
+            coalesce_ms: Window for merging streamed text deltas into one
+                event (flushed early at 64 characters); 0 disables merging
+            reuse_events: Yield one reused dict per text event type instead
+                of a new dict per event; only for consumers that finish with
+                each event before advancing the stream and never keep it
+        """
+        self.client = _get_openai(api_key, base_url)
+        self.api_key = api_key
+        self.base_url = base_url
         self.model = model
+        self.coalesce = coalesce_ms / 1000
+        self.reuse_events = reuse_events
+
+    @staticmethod
+    def build_user_content(context: str, prompt: Optional[str]) -> str:
+        """
+        Build the user message content.
+
+        Sent as one string: OpenAI caches the identical leading context
+        automatically, and not every local OpenAI-compatible server accepts
+        content arrays.
+        """
+        return build_user_message(context, prompt)
 
     def stream_completion(
         self,
         context: str,
         prompt: Optional[str],
         tools: List[Dict[str, Any]],
+        user_content: Optional[str] = None,
     ) -> Iterator[Dict[str, Any]]:
         """
         Stream a completion from OpenAI.
 
+        Args:
+            user_content: The user message from build_user_content, if the
+                caller already built it; otherwise built from context and prompt
+
         Yields:
             {"type": "completion", "content": "..."}
             {"type": "tool_call", "id": "...", "name": "...", "args": {...}}
             {"type": "done"}
         """
-        # Build messages
-        user_message = context
-        if prompt:
-            user_message += f"\n\n{prompt}"
-
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_message}
-        ]
-
-        # Track accumulated tool calls by index
-        tool_calls = {}
-
-        # Stream the response
-        stream = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=tools if tools else None,
-            stream=True,
-        )
-
-        for chunk in stream:
-            if not chunk.choices:
-                continue
-
-            delta = chunk.choices[0].delta
-            finish_reason = chunk.choices[0].finish_reason
-
-            # Handle text content
-            if delta.content:
-                yield {
-                    'type': 'completion',
-                    'content': delta.content
-                }
-
-            # Accumulate tool calls
-            if delta.tool_calls:
-                for tool_call_chunk in delta.tool_calls:
-                    idx = tool_call_chunk.index
-
-                    if idx not in tool_calls:
-                        tool_calls[idx] = {
-                            'id': tool_call_chunk.id or '',
-                            'name': '',
-                            'arguments': '',
-                        }
-
-                    if tool_call_chunk.id:
-                        tool_calls[idx]['id'] = tool_call_chunk.id
-
-                    if tool_call_chunk.function:
-                        if tool_call_chunk.function.name:
-                            tool_calls[idx]['name'] = tool_call_chunk.function.name
-                        if tool_call_chunk.function.arguments:
-                            tool_calls[idx]['arguments'] += tool_call_chunk.function.arguments
-
-            # Yield completed tool calls when stream finishes
-            if finish_reason == 'tool_calls':
-                for tool_call in tool_calls.values():
-                    try:
-                        args = json.loads(tool_call['arguments']) if tool_call['arguments'] else {}
-                    except json.JSONDecodeError:
-                        args = {}
-
-                    yield {
-                        'type': 'tool_call',
-                        'id': tool_call['id'],
-                        'name': tool_call['name'],
-                        'args': args,
-                    }
+        # Read the raw SSE body; the SDK's chunk objects are never built
+        with self.client.chat.completions.with_streaming_response.create(
+            **self._stream_args(context, prompt, tools, user_content)
+        ) as response:
+            state = (_StreamState if tools else _TextStreamState)(self.coalesce, self.reuse_events)
+            for data in iter_sse_data(response.iter_bytes()):
+                if data == b'[DONE]':
+                    break
+                events = state.handle(orjson.loads(data))
+                if events:
+                    yield from events
+            out = state.text.flush()
+            if out is not None:
+                yield out
 
         yield {'type': 'done'}
+
+    async def stream_completion_async(
+        self,
+        context: str,
+        prompt: Optional[str],
+        tools: List[Dict[str, Any]],
+        user_content: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a completion from OpenAI without blocking the event loop.
+
+        Yields the same events as stream_completion, so several completions
+        can run concurrently, e.g. through providers.stream_many.
+        """
+        # A fresh SDK client per stream: its pooled connections belong to the
+        # running event loop, and leaving the block closes them
+        async with AsyncOpenAI(api_key=self.api_key, base_url=self.base_url) as client:
+            async with client.chat.completions.with_streaming_response.create(
+                **self._stream_args(context, prompt, tools, user_content)
+            ) as response:
+                state = (_StreamState if tools else _TextStreamState)(self.coalesce, self.reuse_events)
+                async for data in aiter_sse_data(response.iter_bytes()):
+                    if data == b'[DONE]':
+                        break
+                    events = state.handle(orjson.loads(data))
+                    if events:
+                        for event in events:
+                            yield event
+                out = state.text.flush()
+                if out is not None:
+                    yield out
+
+        yield {'type': 'done'}
+
+    def _stream_args(
+        self,
+        context: str,
+        prompt: Optional[str],
+        tools: List[Dict[str, Any]],
+        user_content: Optional[str],
+    ) -> Dict[str, Any]:
+        """Build the chat.completions.create arguments for a streamed completion."""
+        if user_content is None:
+            user_content = self.build_user_content(context, prompt)
+        args = {
+            'model': self.model,
+            'messages': [
+                self.SYSTEM_MESSAGE,
+                {"role": "user", "content": user_content}
+            ],
+            'stream': True,
+        }
+        if tools:
+            args['tools'] = tools
+        return args
+
+
+def _raise_stream_error(chunk: Dict[str, Any]):
+    """Errors can arrive mid-stream after a successful response status."""
+    error = chunk.get('error')
+    if error:
+        raise RuntimeError(error.get('message') or "OpenAI stream error")
+
+
+class _TextStreamState:
+    """
+    Turns decoded SSE chunks into backend events for a completion without
+    tools, so the per-chunk loop carries no tool-call bookkeeping.
+    """
+
+    __slots__ = ('text',)
+
+    def __init__(self, coalesce: float, reuse_events: bool = False):
+        self.text = DeltaBuffer('completion', coalesce, reuse_event=reuse_events)
+
+    def handle(self, chunk: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Process one stream chunk, returning the events to yield if any."""
+        choices = chunk.get('choices')
+        if not choices:
+            _raise_stream_error(chunk)
+            return None
+
+        content = (choices[0].get('delta') or {}).get('content')
+        if content:
+            out = self.text.add(content)
+            if out is not None:
+                return [out]
+        return None
+
+
+class _ToolCallAcc:
+    """A tool call being assembled from streamed chunks."""
+
+    __slots__ = ('id', 'name', 'arguments')
+
+    def __init__(self, id: str):
+        self.id = id
+        self.name = ''
+        self.arguments = IncrementalJsonParser()
+
+
+class _StreamState(_TextStreamState):
+    """Stream state for a completion with tools, also accumulating tool calls."""
+
+    __slots__ = ('tool_calls',)
+
+    def __init__(self, coalesce: float, reuse_events: bool = False):
+        super().__init__(coalesce, reuse_events)
+        # Accumulated tool calls by index
+        self.tool_calls = {}
+
+    def handle(self, chunk: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Process one stream chunk, returning the events to yield if any."""
+        choices = chunk.get('choices')
+        if not choices:
+            _raise_stream_error(chunk)
+            return None
+
+        # Bind each field once; this runs for every streamed chunk
+        choice = choices[0]
+        delta = choice.get('delta') or {}
+        content = delta.get('content')
+        tool_call_chunks = delta.get('tool_calls')
+        events = None
+
+        # Handle text content
+        if content:
+            out = self.text.add(content)
+            if out is not None:
+                events = [out]
+
+        # Accumulate tool calls
+        if tool_call_chunks:
+            tool_calls = self.tool_calls
+            for tool_call_chunk in tool_call_chunks:
+                idx = tool_call_chunk.get('index', 0)
+                tool_call_id = tool_call_chunk.get('id')
+                acc = tool_calls.get(idx)
+                if acc is None:
+                    acc = tool_calls[idx] = _ToolCallAcc(tool_call_id or '')
+                elif tool_call_id:
+                    acc.id = tool_call_id
+
+                function = tool_call_chunk.get('function')
+                if function:
+                    name = function.get('name')
+                    if name:
+                        acc.name = name
+                    arguments = function.get('arguments')
+                    if arguments:
+                        acc.arguments.feed(arguments)
+
+        # Emit completed tool calls when the stream finishes, after any buffered text
+        if choice.get('finish_reason') == 'tool_calls':
+            if events is None:
+                events = []
+            out = self.text.flush()
+            if out is not None:
+                events.append(out)
+            for acc in self.tool_calls.values():
+                # Arguments cut off mid-stream are completed as far as possible
+                args = acc.arguments.finalize(allow_partial=True) or {}
+
+                events.append({
+                    'type': 'tool_call',
+                    'id': acc.id,
+                    'name': acc.name,
+                    'args': args,
+                })
+
+        return events
@@ -1,19 +1,45 @@
+import asyncio
+import json
 import pytest
-from unittest.mock import Mock, patch
-from providers.anthropic_client import AnthropicClient
+from unittest.mock import MagicMock, patch
+from providers.anthropic_client import AnthropicClient, _get_anthropic
+
+
+@pytest.fixture(autouse=True)
+def clear_client_cache():
+    """Don't let a cached SDK client leak between tests."""
+    _get_anthropic.cache_clear()
+    yield
+    _get_anthropic.cache_clear()
+
+
+def sse_bytes(*events, chunk_size=7):
+    """Encode events as a server-sent event body, split into small byte chunks."""
+    lines = []
+    for event in events:
+        lines += [f"event: {event['type']}", f"data: {json.dumps(event)}", ""]
+    body = "\r\n".join(lines).encode()
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+def mock_sse(MockAnthropic, *events):
+    """Make the mocked SDK return a raw streaming response carrying events."""
+    response = MockAnthropic.return_value.messages.with_streaming_response.create.return_value.__enter__.return_value
+    response.iter_bytes.return_value = sse_bytes(*events)
+
+def text_delta(text):
+    return {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
 
 def test_stream_completion():
     """Test streaming completion from Anthropic."""
     # Mock the anthropic client BEFORE creating the client
     with patch('providers.anthropic_client.Anthropic') as MockAnthropic:
-        mock_stream = [
-            Mock(type='content_block_delta', delta=Mock(type='text_delta', text='def ')),
-            Mock(type='content_block_delta', delta=Mock(type='text_delta', text='foo():')),
-            Mock(type='message_stop'),
-        ]
-        MockAnthropic.return_value.messages.stream.return_value.__enter__.return_value = mock_stream
+        mock_sse(MockAnthropic,
+            text_delta('def '),
+            text_delta('foo():'),
+            {"type": "message_stop"},
+        )
 
-        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet")
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet", coalesce_ms=0)
 
         chunks = list(client.stream_completion(
             context="# Write a function",
@@ -25,3 +51,153 @@ def test_stream_completion():
         assert chunks[0] == {'type': 'completion', 'content': 'def '}
         assert chunks[1] == {'type': 'completion', 'content': 'foo():'}
         assert chunks[2] == {'type': 'done'}
+
+def test_stream_tool_call():
+    """Test thinking deltas and streamed tool input are dispatched by delta type."""
+    with patch('providers.anthropic_client.Anthropic') as MockAnthropic:
+        mock_sse(MockAnthropic,
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "thinking_delta", "thinking": "hmm"}},
+            {"type": "content_block_start", "index": 1, "content_block": {
+                "type": "tool_use", "id": "toolu_1", "name": "get_implementation", "input": {}}},
+            {"type": "content_block_delta", "index": 1, "delta": {
+                "type": "input_json_delta", "partial_json": '{"function_'}},
+            {"type": "content_block_delta", "index": 1, "delta": {
+                "type": "input_json_delta", "partial_json": 'name": "foo"}'}},
+            {"type": "content_block_stop", "index": 1},
+            {"type": "message_stop"},
+        )
+
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet", coalesce_ms=0)
+
+        chunks = list(client.stream_completion(
+            context="# Write a function",
+            prompt=None,
+            tools=[{"name": "get_implementation"}]
+        ))
+
+        assert chunks == [
+            {'type': 'thinking', 'content': 'hmm'},
+            {'type': 'tool_call', 'id': 'toolu_1', 'name': 'get_implementation',
+             'args': {'function_name': 'foo'}},
+            {'type': 'done'},
+        ]
+
+def test_stream_error_event_raises():
+    """Test an error event in the stream is raised, not silently dropped."""
+    with patch('providers.anthropic_client.Anthropic') as MockAnthropic:
+        mock_sse(MockAnthropic,
+            {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+        )
+
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet")
+
+        with pytest.raises(RuntimeError, match="Overloaded"):
+            list(client.stream_completion(context="x", prompt=None, tools=[]))
+
+def test_context_and_prompt_sent_as_separate_blocks():
+    """Test a long context is a cacheable block and the prompt a separate one."""
+    with patch('providers.anthropic_client.Anthropic') as MockAnthropic:
+        mock_sse(MockAnthropic)
+
+        context = "x = 1\n" * 200 + "y = <cursor>"
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet", coalesce_ms=0)
+        list(client.stream_completion(context=context, prompt="add one", tools=[]))
+
+        create = MockAnthropic.return_value.messages.with_streaming_response.create
+        messages = create.call_args.kwargs['messages']
+        assert messages == [{"role": "user", "content": [
+            {"type": "text", "text": context, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": "add one"},
+        ]}]
+
+def test_short_context_is_not_marked_for_caching():
+    """Test a context below the cacheable length carries no cache breakpoint."""
+    content = AnthropicClient.build_user_content("x = <cursor>", None)
+
+    assert content == [{"type": "text", "text": "x = <cursor>"}]
+
+def test_stream_completion_async():
+    """Test the async stream yields the same events as the sync one."""
+    with patch('providers.anthropic_client.AsyncAnthropic') as MockAsyncAnthropic:
+        async def iter_bytes():
+            for chunk in sse_bytes(text_delta('def '), text_delta('foo():'), {"type": "message_stop"}):
+                yield chunk
+
+        sdk = MockAsyncAnthropic.return_value.__aenter__.return_value = MagicMock()
+        response = sdk.messages.with_streaming_response.create.return_value.__aenter__.return_value
+        response.iter_bytes = iter_bytes
+
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet", coalesce_ms=0)
+
+        async def collect():
+            return [chunk async for chunk in client.stream_completion_async(
+                context="# Write a function",
+                prompt=None,
+                tools=[]
+            )]
+
+        assert asyncio.run(collect()) == [
+            {'type': 'completion', 'content': 'def '},
+            {'type': 'completion', 'content': 'foo():'},
+            {'type': 'done'},
+        ]
+
+        # A second event loop gets its own SDK client; each is closed after its stream
+        asyncio.run(collect())
+        assert MockAsyncAnthropic.call_count == 2
+        assert MockAsyncAnthropic.return_value.__aexit__.await_count == 2
+
+def test_stream_completion_coalesces_deltas():
+    """Test text deltas are merged and flushed when their block ends."""
+    with patch('providers.anthropic_client.Anthropic') as MockAnthropic:
+        mock_sse(MockAnthropic,
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            text_delta('def '),
+            text_delta('foo():'),
+            {"type": "content_block_stop", "index": 0},
+            {"type": "content_block_start", "index": 1, "content_block": {
+                "type": "tool_use", "id": "toolu_1", "name": "get_implementation", "input": {}}},
+            {"type": "content_block_stop", "index": 1},
+        )
+
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet", coalesce_ms=1000)
+
+        chunks = list(client.stream_completion(
+            context="# Write a function",
+            prompt=None,
+            tools=[{"name": "get_implementation"}]
+        ))
+
+        assert chunks == [
+            {'type': 'completion', 'content': 'def foo():'},
+            {'type': 'tool_call', 'id': 'toolu_1', 'name': 'get_implementation', 'args': {}},
+            {'type': 'done'},
+        ]
+
+def test_stream_without_tools_keeps_block_order():
+    """Test the tool-free stream still flushes thinking before the text that follows."""
+    with patch('providers.anthropic_client.Anthropic') as MockAnthropic:
+        mock_sse(MockAnthropic,
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "thinking", "thinking": ""}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "thinking_delta", "thinking": "hmm"}},
+            {"type": "content_block_stop", "index": 0},
+            {"type": "content_block_start", "index": 1, "content_block": {"type": "text", "text": ""}},
+            text_delta('x = 1'),
+            {"type": "content_block_stop", "index": 1},
+        )
+
+        client = AnthropicClient(api_key="test-key", model="claude-3-5-sonnet", coalesce_ms=1000)
+
+        chunks = list(client.stream_completion(context="x = ", prompt=None, tools=[]))
+
+        assert chunks == [
+            {'type': 'thinking', 'content': 'hmm'},
+            {'type': 'completion', 'content': 'x = 1'},
+            {'type': 'done'},
+        ]
+
+def test_user_content_is_built_per_call():
+    """Test identical requests get their own content blocks, not a shared cached list."""
+    context = "x = 1\n" * 200
+
+    assert AnthropicClient.build_user_content(context, None) is not AnthropicClient.build_user_content(context, None)
@@ -1,12 +1,26 @@
 import os
 import pytest
-from config import Config
+from config import Config, _ENV_CACHE, _build_env_config
+
+
+@pytest.fixture(autouse=True)
+def clear_env_config():
+    """Drop the memoized environment config between tests."""
+    _build_env_config.cache_clear()
+    yield
+    _build_env_config.cache_clear()
+
+
+def setenv(monkeypatch, key, value):
+    """Set an environment variable as seen by Config (env is read at import)."""
+    monkeypatch.setitem(_ENV_CACHE, key, value)
+
 
 def test_load_from_env(monkeypatch):
     """Test loading configuration from environment variables."""
-    monkeypatch.setenv('AI_REQUEST_PROVIDER', 'anthropic')
-    monkeypatch.setenv('AI_REQUEST_MODEL', 'claude-sonnet-4.5')
-    monkeypatch.setenv('ANTHROPIC_API_KEY', 'sk-test-key')
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'anthropic')
+    setenv(monkeypatch, 'AI_REQUEST_MODEL', 'claude-sonnet-4.5')
+    setenv(monkeypatch, 'ANTHROPIC_API_KEY', 'sk-test-key')
 
     config = Config.from_env()
 
@@ -17,7 +31,7 @@ def test_load_from_env(monkeypatch):
 
 def test_missing_api_key(monkeypatch):
     """Test error when API key missing."""
-    monkeypatch.setenv('AI_REQUEST_PROVIDER', 'openai')
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'openai')
     # Don't set OPENAI_API_KEY
 
     with pytest.raises(ValueError, match="API key not found"):
@@ -25,7 +39,7 @@ def test_missing_api_key(monkeypatch):
 
 def test_local_provider(monkeypatch):
     """Test local provider with optional API key."""
-    monkeypatch.setenv('AI_REQUEST_PROVIDER', 'local')
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'local')
 
     config = Config.from_env()
 
@@ -35,8 +49,8 @@ def test_local_provider(monkeypatch):
 
 def test_default_model_selection(monkeypatch):
     """Test default model is selected when not specified."""
-    monkeypatch.setenv('AI_REQUEST_PROVIDER', 'openai')
-    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'openai')
+    setenv(monkeypatch, 'OPENAI_API_KEY', 'sk-test')
     # Don't set AI_REQUEST_MODEL
 
     config = Config.from_env()
@@ -45,16 +59,22 @@ def test_default_model_selection(monkeypatch):
 
 def test_invalid_timeout_raises_error(monkeypatch):
     """Test that invalid timeout raises ValueError."""
-    monkeypatch.setenv('AI_REQUEST_PROVIDER', 'anthropic')
-    monkeypatch.setenv('ANTHROPIC_API_KEY', 'sk-test')
-    monkeypatch.setenv('AI_REQUEST_TIMEOUT', 'not-a-number')
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'anthropic')
+    setenv(monkeypatch, 'ANTHROPIC_API_KEY', 'sk-test')
+    setenv(monkeypatch, 'AI_REQUEST_TIMEOUT', 'not-a-number')
 
     with pytest.raises(ValueError):
         Config.from_env()
 
 def test_unknown_provider_raises_error(monkeypatch):
     """Test that unknown provider raises ValueError."""
-    monkeypatch.setenv('AI_REQUEST_PROVIDER', 'unknown')
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'unknown')
 
     with pytest.raises(ValueError, match="Invalid provider"):
         Config.from_env()
+
+def test_from_env_is_cached(monkeypatch):
+    """Test repeated from_env calls return the same instance."""
+    setenv(monkeypatch, 'AI_REQUEST_PROVIDER', 'local')
+
+    assert Config.from_env() is Config.from_env()
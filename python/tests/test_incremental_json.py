@@ -0,0 +1,62 @@
+import json
+import orjson
+import pytest
+from incremental_json import IncrementalJsonParser
+
+
+def feed_all(chunks):
+    parser = IncrementalJsonParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser
+
+def test_finalize_chunked_document():
+    """Test a document split at arbitrary points parses once complete."""
+    doc = '{"function_name": "say \\"hi\\"", "nested": {"items": [1, 2, {"a": "]}"}]}}'
+    parser = feed_all([doc[i:i + 3] for i in range(0, len(doc), 3)])
+
+    assert parser.complete
+    assert parser.finalize() == json.loads(doc)
+
+def test_escape_split_across_chunks():
+    """Test an escaped quote split across chunks does not end the string."""
+    parser = feed_all(['{"a": "x\\', '"y"}'])
+
+    assert parser.complete
+    assert parser.finalize() == {"a": 'x"y'}
+
+def test_empty_document():
+    """Test an empty document finalizes to None."""
+    parser = feed_all([])
+
+    assert not parser.complete
+    assert parser.finalize() is None
+
+def test_finalize_malformed_raises():
+    """Test malformed input raises a JSON decode error."""
+    parser = feed_all(['{"a": }'])
+
+    with pytest.raises(orjson.JSONDecodeError):
+        parser.finalize()
+
+@pytest.mark.parametrize("partial, expected", [
+    ('{"function_name": "val', {"function_name": "val"}),
+    ('{"a": 1, "b": n', {"a": 1, "b": None}),
+    ('{"a": 1, "b": tr', {"a": 1, "b": True}),
+    ('{"a": 1, ', {"a": 1}),
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"a": {"b": [1, 2', {"a": {"b": [1, 2]}}),
+    ('{"a', {}),
+])
+def test_snapshot_of_truncated_document(partial, expected):
+    """Test snapshots close open strings, literals and containers."""
+    parser = feed_all([partial])
+
+    assert not parser.complete
+    assert parser.snapshot() == expected
+
+def test_finalize_allow_partial_never_raises():
+    """Test allow_partial completes truncated input and gives None for malformed input."""
+    assert feed_all(['{"a": 1, "b": n']).finalize(allow_partial=True) == {"a": 1, "b": None}
+    assert feed_all(['{"a": }']).finalize(allow_partial=True) is None
+    assert feed_all(['{"a": 1}']).finalize(allow_partial=True) == {"a": 1}
@@ -1,6 +1,8 @@
+import io
+import os
 import json
-from unittest.mock import patch, Mock
-from main import process_request
+from unittest.mock import ANY, patch, Mock
+from main import process_request, ResponseWriter, ConversationStore, writev_all
 
 def test_process_completion_request():
     """Test processing a completion request."""
@@ -15,7 +17,7 @@ def test_process_completion_request():
         }
     }
 
-    with patch('main.AnthropicClient') as MockClient:
+    with patch('providers.anthropic_client.AnthropicClient') as MockClient:
         mock_instance = MockClient.return_value
         mock_instance.stream_completion.return_value = [
             {"type": "completion", "content": "return n * factorial(n-1)"},
@@ -27,3 +29,133 @@ def test_process_completion_request():
         assert len(responses) == 2
         assert responses[0]['type'] == 'completion'
         assert responses[1]['type'] == 'done'
+
+        # The user message is built once and handed to the client
+        mock_instance.build_user_content.assert_called_once_with(request['context'], request['prompt'])
+        mock_instance.stream_completion.assert_called_once_with(
+            request['context'], request['prompt'], ANY, mock_instance.build_user_content.return_value
+        )
+
+def test_response_writer_batches_until_terminal_event():
+    """Test streamed events are buffered and flushed on done."""
+    out = io.BytesIO()
+    writer = ResponseWriter(out)
+
+    writer.write({"type": "completion", "content": "def "})
+    writer.write({"type": "completion", "content": "foo():"})
+    assert out.getvalue() == b""
+
+    writer.write({"type": "done"})
+    lines = out.getvalue().splitlines()
+    assert [json.loads(l) for l in lines] == [
+        {"type": "completion", "content": "def "},
+        {"type": "completion", "content": "foo():"},
+        {"type": "done"},
+    ]
+
+def test_conversation_store_evicts_oldest_and_expired():
+    """Test the conversation store stays bounded by size and age."""
+    store = ConversationStore(max_size=2, ttl=600.0)
+    with patch('main.time.monotonic', return_value=1000.0):
+        store['a'] = {'ts': 1000.0}
+        store['b'] = {'ts': 1000.0}
+        store['c'] = {'ts': 1000.0}
+    assert list(store) == ['b', 'c']
+
+    with patch('main.time.monotonic', return_value=1700.0):
+        store['d'] = {'ts': 1700.0}
+    assert list(store) == ['d']
+
+def test_invalid_request_yields_error():
+    """Test malformed requests are rejected before dispatch."""
+    responses = list(process_request({"type": "complete", "prompt": "hi"}))
+    assert responses == [{"type": "error", "message": "Missing 'context' in complete request"}]
+
+    responses = list(process_request({"type": "bogus"}))
+    assert responses == [{"type": "error", "message": "Unknown request type: bogus"}]
+
+def test_tool_response_finds_tool_call_by_id():
+    """Test a tool response is matched to its stored tool call."""
+    request = {
+        "type": "complete",
+        "request_id": "req-1",
+        "context": "x = ",
+        "config": {"provider": "openai", "api_key": "test-key"},
+    }
+
+    with patch('providers.openai_client.OpenAIClient') as MockClient:
+        MockClient.return_value.stream_completion.return_value = [
+            {"type": "tool_call", "id": "call_1", "name": "get_implementation",
+             "args": {"function_name": "foo"}},
+            {"type": "done"},
+        ]
+        list(process_request(request))
+
+    with patch('main.continue_openai_conversation') as mock_continue:
+        mock_continue.return_value = iter([{"type": "done"}])
+        responses = list(process_request({
+            "type": "tool_response",
+            "request_id": "req-1",
+            "tool_call_id": "call_1",
+            "content": "def foo(): pass",
+        }))
+
+    assert responses == [{"type": "done"}]
+    tool_call = mock_continue.call_args[0][1]
+    assert tool_call['id'] == 'call_1'
+
+def test_response_writer_uses_writev_on_file_descriptors():
+    """Test a batch is written to a real file descriptor in one writev call."""
+    read_fd, write_fd = os.pipe()
+    try:
+        with os.fdopen(write_fd, 'wb') as stream, patch('main.os.writev', wraps=os.writev) as writev:
+            writer = ResponseWriter(stream)
+            writer.write({"type": "completion", "content": "x"})
+            writer.write({"type": "done"})
+            assert writev.call_count == 1
+        data = os.read(read_fd, 4096)
+    finally:
+        os.close(read_fd)
+
+    assert data == b'{"type":"completion","content":"x"}\n{"type":"done"}\n'
+
+def test_writev_all_resumes_after_short_write():
+    """Test writev_all retries the unwritten tail after a short write."""
+    written = []
+
+    def short_writev(fd, buffers):
+        data = b"".join(bytes(b) for b in buffers)[:3]
+        written.append(data)
+        return len(data)
+
+    with patch('main.os.writev', side_effect=short_writev):
+        writev_all(1, [b"ab", b"cde", b"f"])
+
+    assert b"".join(written) == b"abcdef"
+
+def test_process_request_events_are_distinct_by_default():
+    """Test collected completion events keep their own content unless reuse is requested."""
+    from providers.openai_client import _get_openai
+
+    lines = [
+        json.dumps({"choices": [{"index": 0, "delta": {"content": text * 70}, "finish_reason": None}]})
+        for text in ("a", "b", "c")
+    ]
+    body = "".join(f"data: {line}\n\n" for line in lines + ["[DONE]"]).encode()
+    request = {
+        "type": "complete",
+        "context": "x = ",
+        "config": {"provider": "openai", "model": "gpt-4", "api_key": "test-key"},
+    }
+
+    _get_openai.cache_clear()
+    try:
+        with patch('providers.openai_client.OpenAI') as MockOpenAI:
+            create = MockOpenAI.return_value.chat.completions.with_streaming_response.create
+            create.return_value.__enter__.return_value.iter_bytes.return_value = [body]
+
+            responses = list(process_request(request))
+    finally:
+        _get_openai.cache_clear()
+
+    assert [r['content'] for r in responses if r['type'] == 'completion'] == ["a" * 70, "b" * 70, "c" * 70]
@@ -1,19 +1,45 @@
+import asyncio
+import json
 import pytest
-from unittest.mock import Mock, patch
-from providers.openai_client import OpenAIClient
+from unittest.mock import MagicMock, patch
+from providers.openai_client import OpenAIClient, _get_openai
+
+
+@pytest.fixture(autouse=True)
+def clear_client_cache():
+    """Don't let a cached SDK client leak between tests."""
+    _get_openai.cache_clear()
+    yield
+    _get_openai.cache_clear()
+
+
+def sse_bytes(*chunks, chunk_size=7):
+    """Encode chunks as a server-sent event body, split into small byte chunks."""
+    lines = []
+    for chunk in chunks:
+        lines += [f"data: {json.dumps(chunk)}", ""]
+    body = "\n".join(lines + ["data: [DONE]", ""]).encode()
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+def mock_sse(MockOpenAI, *chunks):
+    """Make the mocked SDK return a raw streaming response carrying chunks."""
+    response = MockOpenAI.return_value.chat.completions.with_streaming_response.create.return_value.__enter__.return_value
+    response.iter_bytes.return_value = sse_bytes(*chunks)
+
+def choice(delta, finish_reason=None):
+    return {"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
 
 def test_stream_completion():
     """Test streaming completion from OpenAI."""
     with patch('providers.openai_client.OpenAI') as MockOpenAI:
-        client = OpenAIClient(api_key="test-key", model="gpt-4")
-        
+        client = OpenAIClient(api_key="test-key", model="gpt-4", coalesce_ms=0)
+
         # Mock streaming response
-        mock_chunks = [
-            Mock(choices=[Mock(delta=Mock(content='def ', tool_calls=None))]),
-            Mock(choices=[Mock(delta=Mock(content='foo():', tool_calls=None))]),
-            Mock(choices=[Mock(delta=Mock(content=None, tool_calls=None))]),  # done
-        ]
-        MockOpenAI.return_value.chat.completions.create.return_value = mock_chunks
+        mock_sse(MockOpenAI,
+            choice({"content": "def "}),
+            choice({"content": "foo():"}),
+            choice({}, finish_reason="stop"),
+        )
 
         chunks = list(client.stream_completion(
             context="# Write a function",
@@ -25,3 +51,111 @@ def test_stream_completion():
         assert chunks[0] == {'type': 'completion', 'content': 'def '}
         assert chunks[1] == {'type': 'completion', 'content': 'foo():'}
         assert chunks[2] == {'type': 'done'}
+
+def test_sdk_client_is_shared():
+    """Test clients with the same key and endpoint share one SDK client."""
+    with patch('providers.openai_client.OpenAI') as MockOpenAI:
+        a = OpenAIClient(api_key="test-key", model="gpt-4", coalesce_ms=0)
+        b = OpenAIClient(api_key="test-key", model="gpt-4o")
+
+        assert a.client is b.client
+        MockOpenAI.assert_called_once_with(api_key="test-key", base_url=None)
+
+def test_stream_tool_call():
+    """Test tool-call arguments streamed across chunks are parsed at finish."""
+    with patch('providers.openai_client.OpenAI') as MockOpenAI:
+        client = OpenAIClient(api_key="test-key", model="gpt-4", coalesce_ms=0)
+
+        mock_sse(MockOpenAI,
+            choice({"tool_calls": [{"index": 0, "id": "call_1", "function": {
+                "name": "get_implementation", "arguments": '{"function_'}}]}),
+            choice({"tool_calls": [{"index": 0, "function": {"arguments": 'name": "foo"}'}}]}),
+            choice({}, finish_reason="tool_calls"),
+        )
+
+        chunks = list(client.stream_completion(
+            context="# Write a function",
+            prompt=None,
+            tools=[{"type": "function"}]
+        ))
+
+        assert chunks == [
+            {'type': 'tool_call', 'id': 'call_1', 'name': 'get_implementation',
+             'args': {'function_name': 'foo'}},
+            {'type': 'done'},
+        ]
+
+def test_stream_error_chunk_raises():
+    """Test an error payload in the stream is raised, not silently dropped."""
+    with patch('providers.openai_client.OpenAI') as MockOpenAI:
+        mock_sse(MockOpenAI, {"error": {"message": "Rate limited"}})
+
+        client = OpenAIClient(api_key="test-key", model="gpt-4")
+
+        with pytest.raises(RuntimeError, match="Rate limited"):
+            list(client.stream_completion(context="x", prompt=None, tools=[]))
+
+def test_stream_completion_async():
+    """Test the async stream yields the same events as the sync one."""
+    with patch('providers.openai_client.AsyncOpenAI') as MockAsyncOpenAI:
+        async def iter_bytes():
+            for chunk in sse_bytes(choice({"content": "def "}), choice({"content": "foo():"})):
+                yield chunk
+
+        sdk = MockAsyncOpenAI.return_value.__aenter__.return_value = MagicMock()
+        response = sdk.chat.completions.with_streaming_response.create.return_value.__aenter__.return_value
+        response.iter_bytes = iter_bytes
+
+        client = OpenAIClient(api_key="test-key", model="gpt-4", coalesce_ms=0)
+
+        async def collect():
+            return [chunk async for chunk in client.stream_completion_async(
+                context="# Write a function",
+                prompt=None,
+                tools=[]
+            )]
+
+        assert asyncio.run(collect()) == [
+            {'type': 'completion', 'content': 'def '},
+            {'type': 'completion', 'content': 'foo():'},
+            {'type': 'done'},
+        ]
+
+def test_stream_completion_coalesces_deltas():
+    """Test small deltas arriving together are merged into one event."""
+    with patch('providers.openai_client.OpenAI') as MockOpenAI:
+        client = OpenAIClient(api_key="test-key", model="gpt-4", coalesce_ms=1000)
+
+        mock_sse(MockOpenAI,
+            choice({"content": "def "}),
+            choice({"content": "foo():"}),
+        )
+
+        chunks = list(client.stream_completion(
+            context="# Write a function",
+            prompt=None,
+            tools=[]
+        ))
+
+        assert chunks == [
+            {'type': 'completion', 'content': 'def foo():'},
+            {'type': 'done'},
+        ]
+
+def test_stream_completion_reuses_event_dict():
+    """Test reuse_events yields one dict, updated in place for each text event."""
+    with patch('providers.openai_client.OpenAI') as MockOpenAI:
+        client = OpenAIClient(api_key="test-key", model="gpt-4", coalesce_ms=0, reuse_events=True)
+
+        mock_sse(MockOpenAI,
+            choice({"content": "def "}),
+            choice({"content": "foo():"}),
+        )
+
+        stream = client.stream_completion(context="# Write a function", prompt=None, tools=[])
+        first = next(stream)
+        assert first == {'type': 'completion', 'content': 'def '}
+        second = next(stream)
+        assert second is first
+        assert second == {'type': 'completion', 'content': 'foo():'}
+        assert next(stream) == {'type': 'done'}
@@ -0,0 +1,52 @@
+import asyncio
+from providers import iter_sse_data, stream_many
+
+
+class FakeClient:
+    """Streams fixed events, pausing before each one."""
+
+    def __init__(self, events, delay, error=None):
+        self.events = events
+        self.delay = delay
+        self.error = error
+
+    async def stream_completion_async(self, context, prompt, tools):
+        for event in self.events:
+            await asyncio.sleep(self.delay)
+            yield event
+        if self.error:
+            raise self.error
+
+
+def collect(clients):
+    async def run():
+        return [item async for item in stream_many(clients, "ctx", None, [[]] * len(clients))]
+    return asyncio.run(run())
+
+def test_stream_many_interleaves_streams():
+    """Test streams run concurrently and events arrive tagged with their client."""
+    slow = FakeClient([{'type': 'completion', 'content': 'a'}, {'type': 'done'}], delay=0.02)
+    fast = FakeClient([{'type': 'completion', 'content': 'b'}, {'type': 'done'}], delay=0.005)
+
+    items = collect([slow, fast])
+
+    assert items[0] == (1, {'type': 'completion', 'content': 'b'})
+    assert [event for index, event in items if index == 0] == slow.events
+    assert [event for index, event in items if index == 1] == fast.events
+
+def test_stream_many_reports_failed_stream():
+    """Test a failing stream yields an error event while the others finish."""
+    failing = FakeClient([{'type': 'completion', 'content': 'a'}], delay=0, error=RuntimeError("boom"))
+    ok = FakeClient([{'type': 'done'}], delay=0.01)
+
+    items = collect([failing, ok])
+
+    assert (0, {'type': 'error', 'message': 'boom'}) in items
+    assert (1, {'type': 'done'}) in items
+
+def test_iter_sse_data_splits_raw_bytes():
+    """Test payloads are reassembled across chunks, including split UTF-8 and a final unterminated line."""
+    body = 'data: {"a": "é"}\r\n\r\n: keep-alive\n\ndata:[DONE]'.encode()
+    chunks = [body[:14], body[14:15], body[15:]]
+
+    assert list(iter_sse_data(chunks)) == ['{"a": "é"}'.encode(), b'[DONE]']
@@ -1,4 +1,4 @@
-from tools import get_tool_definitions
+from tools import convert_tools_for_anthropic, get_tool_definitions, get_anthropic_tool_definitions
 
 def test_get_tool_definitions():
     """Test tool definitions are properly formatted."""
@@ -8,3 +8,22 @@ def test_get_tool_definitions():
     assert tools[0]['type'] == 'function'
     assert tools[0]['function']['name'] == 'get_implementation'
     assert 'function_name' in tools[0]['function']['parameters']['properties']
+
+def test_tool_definitions_are_built_once():
+    """Test both tool formats are built once and the Anthropic one is converted."""
+    assert get_tool_definitions() is get_tool_definitions()
+    assert get_anthropic_tool_definitions() is get_anthropic_tool_definitions()
+
+    tools = get_anthropic_tool_definitions()
+    assert tools[0]['name'] == 'get_implementation'
+    assert 'function_name' in tools[0]['input_schema']['properties']
+
+def test_convert_tools_for_anthropic():
+    """Test the built-in tools reuse their conversion and other lists are walked."""
+    assert convert_tools_for_anthropic(get_tool_definitions()) is get_anthropic_tool_definitions()
+
+    tools = [{"type": "function", "function": {
+        "name": "f", "description": "d", "parameters": {"type": "object"}}}]
+    assert convert_tools_for_anthropic(tools) == [
+        {"name": "f", "description": "d", "input_schema": {"type": "object"}}
+    ]
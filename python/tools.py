@@ -2,32 +2,54 @@
 from typing import List, Dict, Any
 
 
+# OpenAI-compatible tool definitions, built once at import
+_TOOL_DEFS: List[Dict[str, Any]] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_implementation",
+            "description": "Retrieve the full implementation of a function or class from the codebase.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "function_name": {
+                        "type": "string",
+                        "description": "Name of the function or class to retrieve (e.g., 'validateEmail' or 'UserService')"
+                    }
+                },
+                "required": ["function_name"]
+            }
+        }
+    }
+]
+
+
 def get_tool_definitions() -> List[Dict[str, Any]]:
     """
     Get tool definitions for function calling.
 
     Returns OpenAI-compatible tool definition format
     (also works with Anthropic after conversion).
+    The returned list is shared and must not be mutated.
     """
-    return [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_implementation",
-                "description": "Retrieve the full implementation of a function or class from the codebase.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "function_name": {
-                            "type": "string",
-                            "description": "Name of the function or class to retrieve (e.g., 'validateEmail' or 'UserService')"
-                        }
-                    },
-                    "required": ["function_name"]
-                }
-            }
-        }
-    ]
+    return _TOOL_DEFS
+
+
+def _convert_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Walk OpenAI-format tools and build their Anthropic equivalents."""
+    anthropic_tools = []
+    for tool in tools:
+        if tool['type'] == 'function':
+            func = tool['function']
+            anthropic_tools.append({
+                "name": func['name'],
+                "description": func['description'],
+                "input_schema": func['parameters']
+            })
+    return anthropic_tools
+
+
+_ANTHROPIC_TOOL_DEFS = _convert_tools(_TOOL_DEFS)
 
 
 def convert_tools_for_anthropic(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -40,14 +62,18 @@ def convert_tools_for_anthropic(tools: List[Dict[str, Any]]) -> List[Dict[str, A
       "description": "...",
       "input_schema": {...}
     }
+
+    The built-in definitions return their precomputed (shared) conversion.
     """
-    anthropic_tools = []
-    for tool in tools:
-        if tool['type'] == 'function':
-            func = tool['function']
-            anthropic_tools.append({
-                "name": func['name'],
-                "description": func['description'],
-                "input_schema": func['parameters']
-            })
-    return anthropic_tools
+    if tools is _TOOL_DEFS:
+        return _ANTHROPIC_TOOL_DEFS
+    return _convert_tools(tools)
+
+
+def get_anthropic_tool_definitions() -> List[Dict[str, Any]]:
+    """
+    Get tool definitions converted to Anthropic format.
+
+    Converted once at import; the returned list is shared and must not be mutated.
+    """
+    return _ANTHROPIC_TOOL_DEFS